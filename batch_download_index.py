@@ -1,48 +1,184 @@
 #!/usr/bin/env python3
 
 import os
+import atexit
 import sys
 import requests
+from requests.adapters import HTTPAdapter
+import urllib3
+from urllib3.util.retry import Retry
 import csv
-from io import StringIO
+import json
 from datetime import datetime, timedelta
 import argparse
-import subprocess
 import logging
+from logging.handlers import QueueHandler, QueueListener
 import time
+import random
+import shutil
+import threading
+import sqlite3
+import queue
+import collections
 import concurrent.futures
+from concurrent.futures.process import BrokenProcessPool
+import multiprocessing
 from pathlib import Path
 from dotenv import load_dotenv
+from index_ted_packages import init_session, process_package
 
 # Load environment variables from .env file
 load_dotenv()
 
 # Set up logging
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s - %(levelname)s - %(message)s',
-    handlers=[
-        logging.FileHandler("batch_download_index.log"),
-        logging.StreamHandler()
-    ]
-)
+# Worker threads only enqueue records; a single listener thread does the
+# file and console I/O. force=True replaces the console-only handler
+# installed by index_ted_packages on import.
+_log_formatter = logging.Formatter('%(asctime)s - %(levelname)s - %(message)s')
+_file_handler = logging.FileHandler("batch_download_index.log", delay=True)
+_file_handler.setFormatter(_log_formatter)
+_console_handler = logging.StreamHandler()
+_console_handler.setFormatter(_log_formatter)
+
+_log_queue = queue.Queue(-1)
+_log_listener = QueueListener(_log_queue, _file_handler, _console_handler)
+_log_listener.start()
+atexit.register(_log_listener.stop)
+
+# The queue handler only renders the message; the listener's handlers add the prefix
+_queue_handler = QueueHandler(_log_queue)
+_queue_handler.setFormatter(logging.Formatter('%(message)s'))
+logging.basicConfig(level=logging.INFO, handlers=[_queue_handler], force=True)
 logger = logging.getLogger(__name__)
 
-def download_csv(url):
-    """Download the CSV file from the given URL."""
+# Shared HTTP session so every request to the TED server reuses pooled
+# keep-alive connections instead of paying a new TCP+TLS handshake
+_session = requests.Session()
+_adapter = HTTPAdapter(
+    pool_connections=4,
+    pool_maxsize=32,
+    # 429/503 are handled by _request so the rate limiter can react to them
+    max_retries=Retry(total=5, backoff_factor=0.5, status_forcelist=[500, 502, 504])
+)
+_session.mount("https://", _adapter)
+_session.mount("http://", _adapter)
+
+class RateLimiter:
+    """Thread-safe token bucket that slows down when the server pushes back."""
+    
+    def __init__(self, rate, min_rate=0.1, recovery_interval=60):
+        self.max_rate = rate
+        self.rate = rate
+        self.min_rate = min_rate
+        self.recovery_interval = recovery_interval
+        self._tokens = rate
+        self._last = time.monotonic()
+        self._last_throttled = self._last
+        self._last_lowered = float("-inf")
+        self._lock = threading.Lock()
+    
+    def acquire(self):
+        """Block until a request may be sent."""
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                
+                # Ramp back up once the server has stopped complaining for a while
+                if self.rate < self.max_rate and now - self._last_throttled >= self.recovery_interval:
+                    self.rate = min(self.max_rate, self.rate * 2)
+                    self._last_throttled = now
+                    logger.info(f"Raising request rate to {self.rate:.2f}/s")
+                
+                # Allow bursts of up to one second's worth of requests
+                self._tokens = min(max(1.0, self.rate), self._tokens + (now - self._last) * self.rate)
+                self._last = now
+                
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                
+                wait_time = (1 - self._tokens) / self.rate
+            
+            time.sleep(wait_time)
+    
+    def throttle(self):
+        """Halve the request rate after the server asked us to slow down."""
+        with self._lock:
+            now = time.monotonic()
+            self._last_throttled = now
+            
+            # Concurrent requests tend to be rejected in one burst; count that as a single signal
+            if now - self._last_lowered < max(1.0, 1 / self.rate):
+                return
+            
+            self.rate = max(self.min_rate, self.rate / 2)
+            self._tokens = min(self._tokens, max(1.0, self.rate))
+            self._last_lowered = now
+            logger.warning(f"Lowering request rate to {self.rate:.2f}/s")
+
+PACKAGE_URL_TEMPLATE = "https://ted.europa.eu/packages/daily/{}{}"
+
+# Extra packages allowed to queue for the indexers beyond the active downloads
+MAX_PENDING_INDEX = 8
+
+_rate_limiter = RateLimiter(float(os.getenv("MAX_REQUESTS_PER_SECOND", "5")))
+
+def _request(method, url, max_retries=5, **kwargs):
+    """Send a request to the TED server, respecting the shared rate limit and backing off on 429/503."""
+    for attempt in range(max_retries + 1):
+        _rate_limiter.acquire()
+        response = _session.request(method, url, **kwargs)
+        
+        if response.status_code not in (429, 503) or attempt == max_retries:
+            return response
+        
+        _rate_limiter.throttle()
+        
+        # Honour Retry-After when given in seconds, otherwise back off exponentially
+        retry_after = response.headers.get("Retry-After", "")
+        wait_time = int(retry_after) if retry_after.isdigit() else 2 ** attempt
+        wait_time += random.uniform(0, 1)
+        response.close()
+        
+        logger.warning(f"TED server returned {response.status_code} for {url}. Retrying in {wait_time:.1f}s (attempt {attempt + 1}/{max_retries})")
+        time.sleep(wait_time)
+
+def download_csv(url, headers=None):
+    """Request the CSV file from the given URL and return the streaming response.
+    
+    The caller is responsible for closing the response.
+    """
+    response = None
     try:
         logger.info(f"Downloading CSV from {url}")
-        response = requests.get(url)
+        response = _request("GET", url, headers=headers, stream=True)
         response.raise_for_status()
-        return response.text
+        # iter_lines only decodes when an encoding is known
+        response.encoding = response.encoding or "utf-8"
+        return response
     except requests.exceptions.RequestException as e:
         logger.error(f"Failed to download CSV: {e}")
+        # Release the pooled connection held by the unread streaming body
+        if response is not None:
+            response.close()
         return None
 
-def parse_csv(csv_content):
-    """Parse the CSV content and return a list of (OJS, date) tuples."""
+def parse_date(date_str):
+    """Parse a D/M/YYYY date directly, which is much cheaper than strptime.
+    
+    Anything the fast path rejects goes through strptime, which raises
+    ValueError for dates that really are malformed.
+    """
+    try:
+        day, month, year = date_str.split("/")
+        return datetime(int(year), int(month), int(day))
+    except ValueError:
+        return datetime.strptime(date_str, "%d/%m/%Y")
+
+def parse_csv(lines):
+    """Parse an iterable of CSV lines and return a list of (OJS, date) tuples."""
     publications = []
-    csv_reader = csv.reader(StringIO(csv_content))
+    csv_reader = csv.reader(lines)
     
     # Skip header row
     next(csv_reader, None)
@@ -53,23 +189,134 @@ def parse_csv(csv_content):
             date_str = row[1].strip()
             try:
                 # Parse date in the format D/M/YYYY (European format)
-                date = datetime.strptime(date_str, "%d/%m/%Y")
-                publications.append((ojs, date))
+                publications.append((ojs, parse_date(date_str)))
             except ValueError:
                 logger.warning(f"Could not parse date {date_str}")
     
     return publications
 
-def get_available_ojs_for_year(year):
-    """Get all available OJS numbers for a specific year."""
+def load_cached_calendar(cache_path):
+    """Load a cached calendar, returning None if it is missing or unreadable."""
+    try:
+        with open(cache_path, "r") as f:
+            cached = json.load(f)
+        cached["publications"] = [(ojs, datetime.fromisoformat(date)) for ojs, date in cached["publications"]]
+        return cached
+    except (OSError, ValueError, KeyError) as e:
+        if os.path.exists(cache_path):
+            logger.warning(f"Ignoring unreadable calendar cache {cache_path}: {e}")
+        return None
+
+def save_cached_calendar(cache_path, publications, etag, last_modified):
+    """Persist a parsed calendar together with the validators needed to revalidate it."""
+    cached = {
+        "etag": etag,
+        "last_modified": last_modified,
+        "fetched_year": datetime.now().year,
+        "publications": [(ojs, date.isoformat()) for ojs, date in publications]
+    }
+    os.makedirs(os.path.dirname(cache_path), exist_ok=True)
+    tmp_path = f"{cache_path}.tmp"
+    with open(tmp_path, "w") as f:
+        json.dump(cached, f)
+    os.replace(tmp_path, cache_path)
+
+def fetch_calendar(year):
+    """Fetch the parsed release calendar for a year, using the on-disk cache when it is still valid."""
     base_url = os.getenv("TED_CALENDAR_URL", "https://ted.europa.eu/es/release-calendar/-/download/file/CSV")
     csv_url = f"{base_url}/{year}"
+    download_dir = os.getenv("TED_DOWNLOAD_DIR", "/home/ia/TenderSync/OpenSearch/downloads")
+    cache_path = os.path.join(download_dir, "calendar_cache", f"{year}.json")
+    
+    cached = load_cached_calendar(cache_path)
+    
+    # A calendar fetched after its year ended will not change any more
+    if cached and int(year) < cached["fetched_year"]:
+        logger.info(f"Using cached calendar for year {year}")
+        return cached["publications"]
+    
+    # Otherwise ask the server whether our copy is still current
+    headers = {}
+    if cached:
+        if cached.get("etag"):
+            headers["If-None-Match"] = cached["etag"]
+        if cached.get("last_modified"):
+            headers["If-Modified-Since"] = cached["last_modified"]
+    
+    response = download_csv(csv_url, headers=headers)
+    if response is None:
+        return cached["publications"] if cached else []
+    
+    with response:
+        if response.status_code == 304 and cached:
+            logger.info(f"Calendar for year {year} not modified, using cached copy")
+            
+            # Refresh fetched_year so a finished year stops being revalidated
+            if cached["fetched_year"] != datetime.now().year:
+                try:
+                    save_cached_calendar(
+                        cache_path,
+                        cached["publications"],
+                        response.headers.get("ETag", cached.get("etag")),
+                        response.headers.get("Last-Modified", cached.get("last_modified"))
+                    )
+                except OSError as e:
+                    logger.warning(f"Could not cache calendar for year {year}: {e}")
+            return cached["publications"]
+        
+        # Parse while the body streams in rather than buffering it as text first
+        publications = parse_csv(response.iter_lines(decode_unicode=True))
     
-    csv_content = download_csv(csv_url)
-    if not csv_content:
-        return []
+    # An empty calendar is most likely an error page; never cache it, or a past
+    # year would be skipped for good
+    if not publications:
+        return publications
+    
+    try:
+        save_cached_calendar(cache_path, publications, response.headers.get("ETag"), response.headers.get("Last-Modified"))
+    except OSError as e:
+        logger.warning(f"Could not cache calendar for year {year}: {e}")
     
-    publications = parse_csv(csv_content)
+    return publications
+
+# In-flight and completed calendar fetches for this run, keyed by year
+_calendars = {}
+_calendars_lock = threading.Lock()
+
+def get_calendar(year):
+    """Get the release calendar for a year, fetching it at most once per run.
+    
+    Concurrent callers for the same year wait on the first caller's fetch.
+    Empty results are not remembered so a failed fetch can be retried.
+    """
+    with _calendars_lock:
+        future = _calendars.get(year)
+        is_owner = future is None
+        if is_owner:
+            future = _calendars[year] = concurrent.futures.Future()
+    
+    if not is_owner:
+        return future.result()
+    
+    try:
+        publications = fetch_calendar(year)
+    except BaseException as e:
+        with _calendars_lock:
+            del _calendars[year]
+        future.set_exception(e)
+        raise
+    
+    if not publications:
+        with _calendars_lock:
+            del _calendars[year]
+    future.set_result(publications)
+    return publications
+
+def get_available_ojs_for_year(year):
+    """Get all available OJS numbers for a specific year."""
+    publications = get_calendar(year)
+    if not publications:
+        return []
     
     # Filter only publications up to today
     today = datetime.now()
@@ -81,16 +328,30 @@ def get_available_ojs_for_year(year):
     logger.info(f"Found {len(sorted_publications)} available publications for year {year}")
     return sorted_publications
 
-def download_and_index_ojs_wrapper(args):
-    """Wrapper function to handle unpacking of arguments for concurrent execution."""
-    return download_and_index_ojs(*args)
+def get_remote_size(url):
+    """Return the size of a remote file from a HEAD request, or None if it cannot be determined."""
+    try:
+        response = _request("HEAD", url)
+        response.raise_for_status()
+    except requests.exceptions.RequestException as e:
+        logger.warning(f"HEAD request failed for {url}: {e}")
+        return None
+    
+    # With a content encoding the length would not match the decoded file on disk
+    if "Content-Encoding" in response.headers:
+        return None
+    
+    content_length = response.headers.get("Content-Length", "")
+    return int(content_length) if content_length.isdigit() else None
 
-def download_and_index_ojs(year, ojs, date):
-    """Download and index a specific OJS package."""
+def download_ojs(year, ojs, date, existing_files):
+    """Download a specific OJS package, leaving indexing to the caller.
+    
+    existing_files is the set of file names already in the download directory.
+    """
     # Format the OJS part as a 5-digit number with leading zeros (00XXX)
-    ojs_int = int(ojs)
-    ojs_formatted = f"00{ojs_int:03d}"
-    download_url = f"https://ted.europa.eu/packages/daily/{year}{ojs_formatted}"
+    ojs_formatted = f"{int(ojs):05d}"
+    download_url = PACKAGE_URL_TEMPLATE.format(year, ojs_formatted)
     
     # Construct the output path
     download_dir = os.getenv("TED_DOWNLOAD_DIR", "/home/ia/TenderSync/OpenSearch/downloads")
@@ -98,32 +359,51 @@ def download_and_index_ojs(year, ojs, date):
     output_filename = f"{year}{ojs_formatted}{file_extension}"
     output_path = os.path.join(download_dir, output_filename)
     
-    # Ensure download directory exists
-    os.makedirs(download_dir, exist_ok=True)
-    
-    # Download the package
-    logger.info(f"Downloading OJS {ojs} for {date.strftime('%d/%m/%Y')} from {download_url}")
     try:
-        response = requests.get(download_url, stream=True)
-        response.raise_for_status()
+        # Reuse a complete earlier download, or resume a partial one
+        headers = {}
+        if output_filename in existing_files:
+            existing_size = os.path.getsize(output_path)
+            remote_size = get_remote_size(download_url)
+            
+            if remote_size is not None and existing_size == remote_size:
+                logger.info(f"Package already downloaded: {output_path}")
+                return {
+                    "year": year,
+                    "ojs": ojs,
+                    "date": date,
+                    "path": output_path,
+                    "success": True
+                }
+            
+            if remote_size is not None and 0 < existing_size < remote_size:
+                logger.info(f"Resuming download of {output_path} from byte {existing_size}")
+                headers["Range"] = f"bytes={existing_size}-"
         
-        with open(output_path, 'wb') as f:
-            for chunk in response.iter_content(chunk_size=8192):
-                f.write(chunk)
+        # Download the package
+        logger.info(f"Downloading OJS {ojs} for {date.strftime('%d/%m/%Y')} from {download_url}")
+        with _request("GET", download_url, headers=headers, stream=True) as response:
+            response.raise_for_status()
+            # Let urllib3 undo any transfer encoding so the raw stream matches iter_content
+            response.raw.decode_content = True
+            
+            # Only append when the server actually honoured the range request
+            mode = 'ab' if response.status_code == 206 else 'wb'
+            with open(output_path, mode) as f:
+                shutil.copyfileobj(response.raw, f, length=1024 * 1024)
         
         logger.info(f"Download successful: {output_path}")
         
-        # Index the downloaded package
-        result = index_package(output_path)
-        
         return {
             "year": year,
             "ojs": ojs,
             "date": date,
             "path": output_path,
-            "success": result
+            "success": True
         }
-    except requests.exceptions.RequestException as e:
+    except (requests.exceptions.RequestException, urllib3.exceptions.HTTPError, OSError) as e:
+        # Reading response.raw directly surfaces dropped connections as urllib3
+        # errors rather than requests ones; OSError covers the file on disk
         logger.error(f"Failed to download package: {e}")
         return {
             "year": year,
@@ -134,40 +414,101 @@ def download_and_index_ojs(year, ojs, date):
         }
 
 def index_package(package_path):
-    """Index a downloaded package using the index_ted_packages.py script."""
+    """Index a downloaded package in-process using index_ted_packages."""
     url = os.getenv("OPENSEARCH_URL", "http://localhost:9200")
     index = os.getenv("OPENSEARCH_INDEX", "ted_dev")
-    bulk_size = os.getenv("BULK_SIZE", "100")
-    workers = os.getenv("NUM_WORKERS", "10")
+    bulk_size = int(os.getenv("BULK_SIZE", "500"))
+    workers = int(os.getenv("NUM_WORKERS", "10"))
     username = os.getenv("OPENSEARCH_USERNAME", "")
     password = os.getenv("OPENSEARCH_PASSWORD", "")
     
-    cmd = [
-        sys.executable,
-        os.path.join(os.path.dirname(os.path.abspath(__file__)), "index_ted_packages.py"),
-        package_path,
-        "-u", url,
-        "-i", index,
-        "-b", bulk_size,
-        "-w", workers
-    ]
-    
-    if username:
-        cmd.extend(["--username", username])
-    if password:
-        cmd.extend(["--password", password])
-    
     logger.info(f"Indexing package: {package_path}")
     
     try:
-        subprocess.run(cmd, check=True)
+        if not process_package(
+            package_path,
+            url,
+            index,
+            bulk_size,
+            workers,
+            username if username else None,
+            password if password else None
+        ):
+            logger.error(f"Error indexing package {package_path}")
+            return False
         logger.info(f"Successfully indexed package: {package_path}")
         return True
-    except subprocess.CalledProcessError as e:
+    except Exception as e:
         logger.error(f"Error indexing package {package_path}: {e}")
         return False
 
-def process_year_range(start_year, end_year, skip_existing=False, max_concurrent_downloads=3, max_concurrent_years=2):
+class ProcessedStore:
+    """SQLite-backed record of the packages that were downloaded and indexed.
+    
+    Records are handed to a single writer thread, so callers never wait on
+    the database and inserts are committed in batches.
+    """
+    
+    def __init__(self, db_path, commit_every=50):
+        self.commit_every = commit_every
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(db_path, check_same_thread=False)
+        self._conn.executescript(
+            "PRAGMA journal_mode=WAL;"
+            "PRAGMA synchronous=NORMAL;"
+            "CREATE TABLE IF NOT EXISTS processed(id TEXT PRIMARY KEY);"
+        )
+        self._queue = queue.Queue()
+        self._writer = threading.Thread(target=self._write_loop, name="processed-store-writer", daemon=True)
+        self._writer.start()
+    
+    def _write_loop(self):
+        """Insert queued package IDs until close() sends the stop marker."""
+        pending = 0
+        while True:
+            package_id = self._queue.get()
+            if package_id is None:
+                break
+            
+            with self._lock:
+                self._conn.execute("INSERT OR IGNORE INTO processed VALUES (?)", (package_id,))
+                pending += 1
+                if pending >= self.commit_every:
+                    self._conn.commit()
+                    pending = 0
+    
+    def import_text_file(self, tracking_file):
+        """Import package IDs from the plain-text tracking file used by earlier versions."""
+        with open(tracking_file, "r") as f:
+            ids = [(line.strip(),) for line in f if line.strip()]
+        with self._lock:
+            self._conn.executemany("INSERT OR IGNORE INTO processed VALUES (?)", ids)
+            self._conn.commit()
+        logger.info(f"Imported {len(ids)} processed publications from {tracking_file}")
+    
+    def load(self, start_year, end_year):
+        """Return the set of processed package IDs for a range of years."""
+        # IDs are "<year>-<ojs>", so the primary key index serves this as a range scan
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT id FROM processed WHERE id >= ? AND id < ?",
+                (f"{start_year}-", f"{end_year + 1}-")
+            )
+            return {row[0] for row in rows}
+    
+    def add(self, package_id):
+        """Queue a package to be recorded as processed."""
+        self._queue.put(package_id)
+    
+    def close(self):
+        """Write and commit any queued records and close the database."""
+        self._queue.put(None)
+        self._writer.join()
+        with self._lock:
+            self._conn.commit()
+            self._conn.close()
+
+def process_year_range(start_year, end_year, skip_existing=False, max_concurrent_downloads=3, max_concurrent_years=2, max_concurrent_indexing=2):
     """Process a range of years, downloading and indexing all available publications."""
     download_dir = os.getenv("TED_DOWNLOAD_DIR", "/home/ia/TenderSync/OpenSearch/downloads")
     stats = {
@@ -178,35 +519,148 @@ def process_year_range(start_year, end_year, skip_existing=False, max_concurrent
         "skipped": 0
     }
     
-    # Create a tracking file to record processed files
-    tracking_file = os.path.join(download_dir, "processed_publications.txt")
-    processed = set()
-    
-    # Load already processed files if the tracking file exists
-    if os.path.exists(tracking_file):
-        with open(tracking_file, "r") as f:
-            processed = set(line.strip() for line in f)
+    # Record processed files in a SQLite database next to the downloads
+    os.makedirs(download_dir, exist_ok=True)
+    db_path = os.path.join(download_dir, "processed_publications.db")
+    is_new_db = not os.path.exists(db_path)
+    tracker = ProcessedStore(db_path)
     
-    # Process multiple years concurrently
-    with concurrent.futures.ThreadPoolExecutor(max_workers=max_concurrent_years) as year_executor:
-        year_futures = {}
-        
-        # Submit all years to the executor
-        for year in range(start_year, end_year + 1):
-            future = year_executor.submit(process_single_year, year, processed, tracking_file, skip_existing, max_concurrent_downloads)
-            year_futures[future] = year
-        
-        # Process the results as they complete
-        for future in concurrent.futures.as_completed(year_futures):
-            year = year_futures[future]
-            try:
-                year_stats = future.result()
-                # Combine stats
-                for key in stats:
-                    stats[key] += year_stats[key]
-                logger.info(f"Completed processing year {year}")
-            except Exception as e:
-                logger.error(f"Error processing year {year}: {e}")
+    # Carry over the history from the old text tracking file
+    tracking_file = os.path.join(download_dir, "processed_publications.txt")
+    if is_new_db and os.path.exists(tracking_file):
+        tracker.import_text_file(tracking_file)
+    
+    # Only the years being processed are needed, and only when skipping
+    processed = tracker.load(start_year, end_year) if skip_existing else set()
+    
+    # List the download directory once instead of checking each package file
+    existing_files = frozenset(entry.name for entry in os.scandir(download_dir))
+    
+    # Indexing is CPU-bound XML parsing, so it runs in separate processes;
+    # spawn gives each worker a fresh interpreter with its own logging thread.
+    # A worker that dies breaks the whole pool, so it is then replaced.
+    def new_index_pool():
+        return concurrent.futures.ProcessPoolExecutor(max_workers=max_concurrent_indexing, mp_context=multiprocessing.get_context("spawn"), initializer=init_session)
+    
+    def submit_index(package_path):
+        nonlocal index_executor
+        try:
+            return index_executor.submit(index_package, package_path)
+        except BrokenProcessPool:
+            logger.warning("Index worker pool is broken, starting a new one")
+            index_executor.shutdown(wait=False)
+            index_executor = new_index_pool()
+            return index_executor.submit(index_package, package_path)
+    
+    index_executor = new_index_pool()
+    try:
+        # A single loop drives every year: calendars are fetched a few years at a
+        # time, all downloads share one pool and each finished download goes
+        # straight to the index pool, so work flows freely across year boundaries.
+        download_workers = max_concurrent_downloads * max_concurrent_years
+        with concurrent.futures.ThreadPoolExecutor(max_workers=max_concurrent_years) as calendar_executor, \
+                concurrent.futures.ThreadPoolExecutor(max_workers=download_workers) as download_executor:
+            calendars = {
+                calendar_executor.submit(get_available_ojs_for_year, str(year)): year
+                for year in range(start_year, end_year + 1)
+            }
+            downloads = {}
+            indexing = {}
+            remaining = {}
+            
+            # Packages wait here for a download slot. New downloads only start while
+            # the packages downloading or waiting for an indexer fit in the download
+            # pool plus MAX_PENDING_INDEX, so downloading pauses when indexing falls
+            # behind instead of running through the whole range.
+            queued = collections.deque()
+            max_in_flight = download_workers + max_concurrent_indexing + MAX_PENDING_INDEX
+            
+            while calendars or downloads or indexing:
+                done, _ = concurrent.futures.wait(
+                    list(calendars) + list(downloads) + list(indexing),
+                    return_when=concurrent.futures.FIRST_COMPLETED
+                )
+                
+                for future in done:
+                    if future in calendars:
+                        year = calendars.pop(future)
+                        try:
+                            publications = future.result()
+                        except Exception as e:
+                            logger.error(f"Error processing year {year}: {e}")
+                            continue
+                        
+                        if not publications:
+                            logger.warning(f"No publications found for year {year}")
+                            continue
+                        
+                        logger.info(f"Processing year {year}")
+                        remaining[year] = 0
+                        for ojs, date in publications:
+                            package_id = f"{year}-{ojs}"
+                            stats["total"] += 1
+                            
+                            # Skip if already processed
+                            if skip_existing and package_id in processed:
+                                logger.info(f"Skipping already processed publication: {package_id}")
+                                stats["skipped"] += 1
+                                continue
+                            
+                            queued.append((year, ojs, date))
+                            remaining[year] += 1
+                    elif future in downloads:
+                        year = downloads.pop(future)
+                        
+                        # download_ojs reports expected failures itself; anything
+                        # else only fails this package, not the whole run
+                        try:
+                            result = future.result()
+                        except Exception as e:
+                            logger.error(f"Error downloading package for year {year}: {e}")
+                            result = {"success": False}
+                        
+                        if result['success']:
+                            stats["downloaded"] += 1
+                            package_id = f"{year}-{result['ojs']}"
+                            indexing[submit_index(result['path'])] = (year, package_id)
+                            continue
+                        
+                        stats["failed"] += 1
+                        remaining[year] -= 1
+                    else:
+                        year, package_id = indexing.pop(future)
+                        
+                        # A crashed worker process surfaces here rather than in index_package
+                        try:
+                            indexed = future.result()
+                        except Exception as e:
+                            logger.error(f"Error indexing package {package_id}: {e}")
+                            indexed = False
+                        
+                        if indexed:
+                            stats["indexed"] += 1
+                            
+                            # Mark as processed
+                            tracker.add(package_id)
+                            processed.add(package_id)
+                        else:
+                            stats["failed"] += 1
+                        remaining[year] -= 1
+                    
+                    if remaining.get(year) == 0:
+                        del remaining[year]
+                        logger.info(f"Completed processing year {year}")
+                
+                while queued and len(downloads) + len(indexing) < max_in_flight:
+                    year, ojs, date = queued.popleft()
+                    downloads[download_executor.submit(download_ojs, str(year), ojs, date, existing_files)] = year
+    finally:
+        # Flush the last partial batch even if the run is interrupted, and
+        # before waiting on the index pool so a stuck worker cannot lose it
+        try:
+            tracker.close()
+        finally:
+            index_executor.shutdown()
     
     # Print statistics
     logger.info("Batch processing completed")
@@ -217,60 +671,6 @@ def process_year_range(start_year, end_year, skip_existing=False, max_concurrent
     
     return stats
 
-def process_single_year(year, processed, tracking_file, skip_existing, max_concurrent_downloads):
-    """Process a single year, downloading and indexing all available publications."""
-    year_stats = {
-        "total": 0,
-        "downloaded": 0,
-        "indexed": 0,
-        "failed": 0,
-        "skipped": 0
-    }
-    
-    logger.info(f"Processing year {year}")
-    publications = get_available_ojs_for_year(str(year))
-    
-    if not publications:
-        logger.warning(f"No publications found for year {year}")
-        return year_stats
-    
-    # Group the publications into batches for parallel processing
-    download_tasks = []
-    for ojs, date in publications:
-        package_id = f"{year}-{ojs}"
-        year_stats["total"] += 1
-        
-        # Skip if already processed
-        if skip_existing and package_id in processed:
-            logger.info(f"Skipping already processed publication: {package_id}")
-            year_stats["skipped"] += 1
-            continue
-        
-        download_tasks.append((str(year), ojs, date))
-    
-    # Process downloads in parallel
-    with concurrent.futures.ThreadPoolExecutor(max_workers=max_concurrent_downloads) as executor:
-        results = list(executor.map(download_and_index_ojs_wrapper, download_tasks))
-        
-        for result in results:
-            package_id = f"{result['year']}-{result['ojs']}"
-            
-            if result['success']:
-                year_stats["downloaded"] += 1
-                year_stats["indexed"] += 1
-                
-                # Mark as processed
-                with open(tracking_file, "a") as f:
-                    f.write(f"{package_id}\n")
-                processed.add(package_id)
-            else:
-                year_stats["failed"] += 1
-            
-            # Add a small delay between batches to be nice to the server
-            time.sleep(0.5)
-    
-    return year_stats
-
 def main():
     current_year = datetime.now().year
     
@@ -283,10 +683,13 @@ def main():
                         help="Skip already processed publications")
     parser.add_argument("--max-concurrent-downloads", type=int, 
                         default=int(os.getenv("MAX_CONCURRENT_DOWNLOADS", "3")),
-                        help="Maximum number of concurrent downloads per year")
+                        help="Maximum number of concurrent downloads per year being processed")
     parser.add_argument("--max-concurrent-years", type=int, 
                         default=int(os.getenv("MAX_CONCURRENT_YEARS", "2")),
                         help="Maximum number of years to process in parallel")
+    parser.add_argument("--max-concurrent-indexing", type=int, 
+                        default=int(os.getenv("MAX_CONCURRENT_INDEXING", "2")),
+                        help="Maximum number of packages to index in parallel")
     
     args = parser.parse_args()
     
@@ -301,6 +704,7 @@ def main():
     logger.info(f"Starting batch download and indexing from {args.start_year} to {args.end_year}")
     logger.info(f"Using up to {args.max_concurrent_downloads} concurrent downloads per year")
     logger.info(f"Processing up to {args.max_concurrent_years} years in parallel")
+    logger.info(f"Indexing up to {args.max_concurrent_indexing} packages in parallel")
     
     # Process the year range
     stats = process_year_range(
@@ -308,7 +712,8 @@ def main():
         args.end_year, 
         args.skip_existing,
         args.max_concurrent_downloads,
-        args.max_concurrent_years
+        args.max_concurrent_years,
+        args.max_concurrent_indexing
     )
     
     if stats["failed"] > 0:
@@ -61,7 +61,7 @@ def run_index_script(package_path, url=None, index=None, bulk_size=None, workers
     # Use provided values or fall back to .env values
     url = url or os.getenv("OPENSEARCH_URL", "http://localhost:9200")
     index = index or os.getenv("OPENSEARCH_INDEX", "ted")
-    bulk_size = bulk_size or os.getenv("BULK_SIZE", "100")
+    bulk_size = bulk_size or os.getenv("BULK_SIZE", "500")
     workers = workers or os.getenv("NUM_WORKERS", "10")
     username = username or os.getenv("OPENSEARCH_USERNAME", "")
     password = password or os.getenv("OPENSEARCH_PASSWORD", "")
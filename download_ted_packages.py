@@ -1,10 +1,13 @@
 #!/usr/bin/env python3
 
 import requests
-import csv
-from io import StringIO
+from requests.adapters import HTTPAdapter
+import urllib3
+from urllib3.util.retry import Retry
 from datetime import datetime
 import os
+import shutil
+import heapq
 import sys
 import argparse
 from dotenv import load_dotenv
@@ -12,56 +15,71 @@ from dotenv import load_dotenv
 # Load environment variables from .env file
 load_dotenv()
 
+# Shared HTTP session so the calendar and package downloads reuse one connection
+_session = requests.Session()
+_adapter = HTTPAdapter(max_retries=Retry(total=3, backoff_factor=0.3, status_forcelist=[429, 502, 503, 504]))
+_session.mount("https://", _adapter)
+_session.mount("http://", _adapter)
+
 def download_csv(url):
     """Download the CSV file from the given URL."""
     try:
-        response = requests.get(url)
+        response = _session.get(url)
         response.raise_for_status()
         return response.text
     except requests.exceptions.RequestException as e:
         print(f"Failed to download CSV: {e}")
         sys.exit(1)
 
+def parse_date(date_str):
+    """Parse a D/M/YYYY date directly, which is much cheaper than strptime.
+    
+    Anything the fast path rejects goes through strptime, which raises
+    ValueError for dates that really are malformed.
+    """
+    try:
+        day, month, year = date_str.split("/")
+        return datetime(int(year), int(month), int(day))
+    except ValueError:
+        return datetime.strptime(date_str, "%d/%m/%Y")
+
 def parse_csv(csv_content):
-    """Parse the CSV content and return a list of (OJS, date) tuples."""
+    """Parse the CSV content and return a list of (OJS, date) tuples.
+    
+    The calendar is a plain two-column file without quoting, so lines are
+    split directly rather than going through the csv module.
+    """
     publications = []
-    csv_reader = csv.reader(StringIO(csv_content))
     
     # Skip header row
-    next(csv_reader, None)
-    
-    for row in csv_reader:
-        if len(row) >= 2:
-            ojs = row[0].strip()
-            date_str = row[1].strip()
+    for line in csv_content.splitlines()[1:]:
+        fields = line.split(",", 2)
+        if len(fields) >= 2:
+            ojs = fields[0].strip()
+            date_str = fields[1].strip()
             try:
                 # Parse date in the format D/M/YYYY (European format)
-                date = datetime.strptime(date_str, "%d/%m/%Y")
-                publications.append((ojs, date))
+                publications.append((ojs, parse_date(date_str)))
             except ValueError:
                 print(f"Warning: Could not parse date {date_str}")
     
     return publications
 
-def get_latest_available_ojs(publications):
+def get_latest_available_ojs(publications, debug=False):
     """Get the latest available OJS by comparing publication dates with today."""
     today = datetime.now()
     print(f"Current date: {today.strftime('%d/%m/%Y')}")
     
-    # Debug each publication's comparison with today
-    available_publications = []
-    for ojs, date in publications:
-        is_available = date <= today
-        if is_available:
-            available_publications.append((ojs, date))
-            
-    if not available_publications:
+    # Single pass over the calendar for the most recent publication not in the future
+    latest = max(((ojs, date) for ojs, date in publications if date <= today), key=lambda x: x[1], default=None)
+    
+    if latest is None:
         print("No available publications found.")
         sys.exit(1)
     
-    # Sort by date to get the most recent one
-    latest = max(available_publications, key=lambda x: x[1])
-    print(f"All available publications: {[(ojs, date.strftime('%d/%m/%Y')) for ojs, date in sorted(available_publications, key=lambda x: x[1], reverse=True)[:5]]}")
+    if debug:
+        recent = heapq.nlargest(5, (p for p in publications if p[1] <= today), key=lambda x: x[1])
+        print(f"Most recent available publications: {[(ojs, date.strftime('%d/%m/%Y')) for ojs, date in recent]}")
     
     return latest
 
@@ -71,16 +89,15 @@ def construct_download_url(ojs, year):
     Format: https://ted.europa.eu/packages/daily/YYYYOOJJJ
     Example: For OJS 103 in 2025, the URL is https://ted.europa.eu/packages/daily/202500103
     """
-    # Convert ojs to integer to remove leading zeros if present
-    ojs_int = int(ojs)
-    # Format the OJS part as a 5-digit number with leading zeros (00XXX)
-    ojs_formatted = f"00{ojs_int:03d}"
+    # Format the OJS part as a 5-digit number with leading zeros (00XXX),
+    # normalising any leading zeros already present
+    ojs_formatted = f"{int(ojs):05d}"
     return f"https://ted.europa.eu/packages/daily/{year}{ojs_formatted}"
 
 def download_package(url, output_dir):
     """Download the package from the URL and save to the output directory."""
     try:
-        response = requests.get(url, stream=True)
+        response = _session.get(url, stream=True)
         response.raise_for_status()
         
         # Create output directory if it doesn't exist
@@ -93,13 +110,15 @@ def download_package(url, output_dir):
         filename = url.split('/')[-1] + file_extension
         output_path = os.path.join(output_dir, filename)
         
-        with open(output_path, 'wb') as f:
-            for chunk in response.iter_content(chunk_size=8192):
-                f.write(chunk)
+        # Copy the raw stream in large blocks; decode_content keeps it equivalent to iter_content
+        response.raw.decode_content = True
+        with open(output_path, 'wb', buffering=1024 * 1024) as f:
+            shutil.copyfileobj(response.raw, f, length=256 * 1024)
         
         print(f"Package downloaded successfully to {output_path}")
         return output_path
-    except requests.exceptions.RequestException as e:
+    except (requests.exceptions.RequestException, urllib3.exceptions.HTTPError) as e:
+        # Reading response.raw directly surfaces dropped connections as urllib3 errors
         print(f"Failed to download package: {e}")
         # Print the URL that failed for debugging
         print(f"Failed URL: {url}")
@@ -113,6 +132,9 @@ def main():
     parser.add_argument("-o", "--output", 
                         default=os.getenv("TED_DOWNLOAD_DIR", "/home/ia/TenderSync/OpenSearch/downloads"),
                         help=f"Output directory for downloaded packages (default: {os.getenv('TED_DOWNLOAD_DIR', '/home/ia/TenderSync/OpenSearch/downloads')})")
+    parser.add_argument("--debug",
+                        action="store_true",
+                        help="Print the most recent available publications")
     
     args = parser.parse_args()
     
@@ -131,7 +153,7 @@ def main():
         sys.exit(1)
     
     print("Finding the latest available publication...")
-    latest_ojs, latest_date = get_latest_available_ojs(publications)
+    latest_ojs, latest_date = get_latest_available_ojs(publications, debug=args.debug)
     print(f"Latest available OJS: {latest_ojs}, Date: {latest_date.strftime('%d/%m/%Y')}")
     
     # Add safeguard against future dates
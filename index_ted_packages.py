@@ -4,20 +4,51 @@ import os
 import sys
 import zipfile
 import tarfile
+import gzip
 import argparse
 import json
-import xml.etree.ElementTree as ET
 import concurrent.futures
+from concurrent.futures.process import BrokenProcessPool
+import multiprocessing
+import multiprocessing.util
 from pathlib import Path
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 from tqdm import tqdm
 import logging
 import tempfile
 import shutil
 import time
 import re
+import collections
+import contextlib
+import threading
 from dotenv import load_dotenv
 
+try:
+    # lxml parses in C, several times faster than ElementTree
+    from lxml import etree as ET
+    HAVE_LXML = True
+    XMLParseError = ET.XMLSyntaxError
+except ImportError:
+    import xml.etree.ElementTree as ET
+    HAVE_LXML = False
+    XMLParseError = ET.ParseError
+
+try:
+    # orjson is a C extension that serializes several times faster and returns bytes
+    from orjson import dumps as json_dumps_bytes
+except ImportError:
+    def json_dumps_bytes(obj):
+        return json.dumps(obj).encode("utf-8")
+
+try:
+    # python-isal decompresses gzip several times faster than the stdlib
+    from isal import igzip_threaded
+except ImportError:
+    igzip_threaded = None
+
 # Load environment variables from .env file
 load_dotenv()
 
@@ -29,6 +60,106 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
+# Shared HTTP session so bulk and index-management requests reuse pooled
+# keep-alive connections to OpenSearch instead of reconnecting every time.
+# POSTs (bulk, open/close) are not retried by the adapter; send_bulk_body does its own.
+# It is built once per process on first use (or by init_session when used as a
+# process pool initializer), so XML parsing workers never create one.
+_session = None
+_session_lock = threading.Lock()
+
+def init_session():
+    """Build this process's pooled HTTP session for OpenSearch requests."""
+    global _session
+    with _session_lock:
+        if _session is None:
+            session = requests.Session()
+            adapter = HTTPAdapter(
+                pool_connections=8,
+                pool_maxsize=32,
+                max_retries=Retry(total=3, backoff_factor=0.3, status_forcelist=[429, 502, 503, 504])
+            )
+            session.mount("https://", adapter)
+            session.mount("http://", adapter)
+            _session = session
+
+def get_session():
+    """Return this process's pooled HTTP session, building it if needed."""
+    if _session is None:
+        init_session()
+    return _session
+
+# XML parsing pool, kept for the life of the process so that indexing several
+# packages in a row does not start a fresh set of interpreters for each one
+_xml_pool = None
+_xml_pool_size = None
+_xml_pool_lock = threading.Lock()
+
+def get_xml_pool(num_workers, broken=None):
+    """Return this process's XML parsing pool, building it if needed or replacing
+    it if it has a different size or is the given broken pool."""
+    global _xml_pool, _xml_pool_size
+    with _xml_pool_lock:
+        if _xml_pool is None or _xml_pool_size != num_workers or _xml_pool is broken:
+            if _xml_pool is not None:
+                _xml_pool.shutdown(wait=False)
+            # Spawned workers start clean instead of inheriting the parent's threads and log handlers
+            _xml_pool = concurrent.futures.ProcessPoolExecutor(max_workers=num_workers, mp_context=multiprocessing.get_context("spawn"))
+            _xml_pool_size = num_workers
+            
+            # Shut the pool down when this process exits. atexit does not run in
+            # multiprocessing children (e.g. the batch script's index workers),
+            # which would otherwise wait forever on the idle parsing workers.
+            # The priority is above the pool queues' own finalizers (10) so the
+            # stop messages are still sent before those queues are closed.
+            multiprocessing.util.Finalize(None, _xml_pool.shutdown, exitpriority=100)
+        return _xml_pool
+
+# Upper bound on the uncompressed size of a single bulk request
+MAX_BULK_BYTES = int(os.getenv("BULK_MAX_BYTES", str(10 * 1024 * 1024)))
+
+# Number of XML files sent to a worker process at a time
+XML_BATCH_SIZE = 16
+
+# Read buffer for tar archives, far above tarfile's 10 KiB default
+TAR_BUFSIZE = 1024 * 1024
+
+@contextlib.contextmanager
+def open_tar_gz(package_path):
+    """Open a .tar.gz for sequential reading, decompressing with python-isal when available."""
+    # Read the tar as a stream with a large buffer: seeking backwards in a gzip
+    # stream means decompressing it again, and small reads are syscall-bound
+    if igzip_threaded is None:
+        gz_file = gzip.open(package_path, 'rb')
+    else:
+        # Decompress on a background thread
+        gz_file = igzip_threaded.open(package_path, 'rb', threads=2)
+    
+    with gz_file, tarfile.open(fileobj=gz_file, mode='r|', bufsize=TAR_BUFSIZE) as tar_ref:
+        yield tar_ref
+        
+        # A streamed tar stops quietly at a damaged header, so read the gzip
+        # stream to its end to surface truncation or CRC errors
+        while gz_file.read(TAR_BUFSIZE):
+            pass
+
+def is_gzip_file(path):
+    """Check the gzip magic number to tell tar.gz packages from zip files."""
+    with open(path, 'rb') as f:
+        return f.read(2) == b'\x1f\x8b'
+
+def iter_tar_xml(tar_ref):
+    """Yield (name, bytes) for each XML member of a tar archive, in archive order."""
+    for member in tar_ref:
+        if member.isfile() and member.name.endswith('.xml'):
+            yield member.name, tar_ref.extractfile(member).read()
+
+def extract_zip(package_path, output_dir):
+    """Extract a zip file, reading members in the order they are stored."""
+    with zipfile.ZipFile(package_path, 'r') as zip_ref:
+        members = sorted(zip_ref.infolist(), key=lambda info: info.header_offset)
+        zip_ref.extractall(output_dir, members=members)
+
 def extract_package(package_path, output_dir):
     """Extract TED package to the specified directory, handling both zip and tar.gz formats."""
     logger.info(f"Extracting {package_path} to {output_dir}")
@@ -36,23 +167,22 @@ def extract_package(package_path, output_dir):
         # Check file extension or try to determine file type
         if package_path.endswith('.zip'):
             # Handle zip files
-            with zipfile.ZipFile(package_path, 'r') as zip_ref:
-                zip_ref.extractall(output_dir)
+            extract_zip(package_path, output_dir)
         elif package_path.endswith('.tar.gz') or package_path.endswith('.tgz'):
             # Handle tar.gz files
-            with tarfile.open(package_path, 'r:gz') as tar_ref:
+            with open_tar_gz(package_path) as tar_ref:
                 # Add filter='data' to address Python 3.14 deprecation warning
                 tar_ref.extractall(output_dir, filter='data')
         else:
             # Try to guess the format
             try:
                 # Try as tar.gz first
-                with tarfile.open(package_path, 'r:gz') as tar_ref:
+                with open_tar_gz(package_path) as tar_ref:
                     tar_ref.extractall(output_dir, filter='data')
-            except tarfile.ReadError:
+            except (tarfile.ReadError, OSError):
+                # python-isal reports a non-gzip file as an OSError rather than a ReadError
                 # Try as zip
-                with zipfile.ZipFile(package_path, 'r') as zip_ref:
-                    zip_ref.extractall(output_dir)
+                extract_zip(package_path, output_dir)
         
         return True
     except zipfile.BadZipFile:
@@ -68,93 +198,200 @@ def extract_package(package_path, output_dir):
 def find_xml_files(directory):
     """Find all XML files in the given directory."""
     xml_files = []
-    for root, _, files in os.walk(directory):
-        for file in files:
-            if file.endswith(".xml"):
-                xml_files.append(os.path.join(root, file))
+    # Breadth-first scandir walk: DirEntry caches the file type, saving the
+    # extra stat calls and per-directory lists that os.walk makes
+    pending_dirs = collections.deque([directory])
+    while pending_dirs:
+        with os.scandir(pending_dirs.popleft()) as entries:
+            for entry in entries:
+                if entry.is_dir(follow_symlinks=False):
+                    pending_dirs.append(entry.path)
+                elif entry.name.endswith(".xml"):
+                    xml_files.append(entry.path)
     
     logger.info(f"Found {len(xml_files)} XML files")
     return xml_files
 
-def xml_to_dict(xml_file):
-    """Parse XML file and convert to a dictionary."""
-    try:
-        tree = ET.parse(xml_file)
-        root = tree.getroot()
+# lxml parsers are not thread-safe, so each thread reuses its own
+_parser_local = threading.local()
+
+def get_xml_parser():
+    """Return this thread's reusable XML parser, or None for the ElementTree default."""
+    if not HAVE_LXML:
+        return None
+    
+    parser = getattr(_parser_local, "parser", None)
+    if parser is None:
+        parser = ET.XMLParser(huge_tree=True, remove_blank_text=True, remove_comments=True, remove_pis=True, collect_ids=False)
+        _parser_local.parser = parser
+    return parser
+
+# Maps namespaced tags to their local names. TED documents use a small,
+# recurring set of tags, so each is only split once per process and the
+# resulting dict keys are shared between documents.
+_local_names = {}
+
+def element_to_dict(root):
+    """Convert an element tree to nested dicts, removing namespace prefixes from child tags."""
+    result = {}
+    stack = [(root, result)]
+    push = stack.append
+    pop = stack.pop
+    local_names = _local_names
+    local_name = local_names.get
+    while stack:
+        element, node = pop()
         
-        # Remove namespace prefixes for easier data access
-        for elem in root.iter():
-            if '}' in elem.tag:
-                elem.tag = elem.tag.split('}', 1)[1]
+        # Add attributes
+        attrib = element.attrib
+        if attrib:
+            node.update(attrib)
         
-        # Function to convert Element to dict
-        def element_to_dict(element):
-            result = {}
-            
-            # Add attributes
-            if element.attrib:
-                result.update(element.attrib)
-            
-            # Add text content if it exists and is not just whitespace
-            if element.text and element.text.strip():
-                result['text'] = element.text.strip()
+        # Add text content if it exists and is not just whitespace
+        text = element.text
+        if text:
+            text = text.strip()
+            if text:
+                node['text'] = text
+        
+        # Add children
+        for child in element:
+            tag = child.tag
+            local = local_name(tag)
+            if local is None:
+                # Strip any "{namespace}" prefix; find() is -1 when there is none
+                local = local_names[tag] = tag[tag.find('}') + 1:]
+            tag = local
             
-            # Add children
-            for child in element:
-                child_dict = element_to_dict(child)
-                if child.tag in result:
-                    if not isinstance(result[child.tag], list):
-                        result[child.tag] = [result[child.tag]]
-                    result[child.tag].append(child_dict)
-                else:
-                    result[child.tag] = child_dict
+            if len(child):
+                child_node = {}
+                push((child, child_node))
+            else:
+                attrib = child.attrib
+                child_node = dict(attrib) if attrib else {}
+                text = child.text
+                if text:
+                    text = text.strip()
+                    if text:
+                        child_node['text'] = text
             
-            return result
+            existing = node.get(tag)
+            if existing is None:
+                node[tag] = child_node
+            elif type(existing) is list:
+                existing.append(child_node)
+            else:
+                node[tag] = [existing, child_node]
+    
+    return result
+
+def xml_to_dict(xml_file, data=None):
+    """Parse XML file and convert to a dictionary.
+    
+    If data is given it holds the file's bytes (e.g. read from an archive)
+    and xml_file is only used as its name.
+    """
+    try:
+        if data is None:
+            # Read the whole file with a single read() rather than letting the
+            # parser pull it in many small chunks
+            with open(xml_file, "rb") as f:
+                data = f.read()
+        root = ET.fromstring(data, get_xml_parser())
         
-        # Include the filename as part of the document
         result = element_to_dict(root)
+        
+        # Include the filename as part of the document
         result['_filename'] = os.path.basename(xml_file)
         result['_filepath'] = xml_file
         
         return result
-    except ET.ParseError as e:
+    except XMLParseError as e:
         logger.error(f"Error parsing XML file {xml_file}: {e}")
         return None
     except Exception as e:
         logger.error(f"Unexpected error processing {xml_file}: {e}")
         return None
 
-def process_xml_file(xml_file):
-    """Process a single XML file."""
-    doc = xml_to_dict(xml_file)
+def process_xml_file(xml_file, data=None):
+    """Process a single XML file, optionally from its bytes already in memory.
+    
+    Returns a (doc_id, source) tuple, or None if the file could not be parsed.
+    """
+    doc = xml_to_dict(xml_file, data)
     if doc:
         # Create a unique ID based on the filename
         doc_id = os.path.splitext(os.path.basename(xml_file))[0]
-        return {"_id": doc_id, "_source": doc}
+        return doc_id, doc
     return None
 
+def serialize_doc(index_name, doc_id, source):
+    """Serialize one document as its NDJSON bulk action and source lines."""
+    return (json_dumps_bytes({"index": {"_index": index_name, "_id": doc_id}}) + b"\n"
+            + json_dumps_bytes(source) + b"\n")
+
+def process_xml_batch(items, index_name):
+    """Process a batch of (name, data) XML items in a worker process.
+    
+    Documents are returned already serialized as NDJSON bulk lines (None for
+    files that failed), so the parent never pickles or re-encodes the dicts.
+    """
+    results = []
+    for xml_file, data in items:
+        doc = process_xml_file(xml_file, data)
+        results.append(serialize_doc(index_name, *doc) if doc else None)
+    return results
+
 def chunk_list(lst, chunk_size):
     """Split a list into chunks of the specified size."""
     for i in range(0, len(lst), chunk_size):
         yield lst[i:i + chunk_size]
 
-def bulk_index(opensearch_url, index_name, docs, username=None, password=None):
-    """Index multiple documents in bulk with retry mechanism."""
-    if not docs:
+def chunk_iter(iterable, chunk_size):
+    """Split any iterable into lists of the specified size without materializing it."""
+    chunk = []
+    for item in iterable:
+        chunk.append(item)
+        if len(chunk) >= chunk_size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+def bulk_index_raw(opensearch_url, chunks, username=None, password=None):
+    """Index pre-serialized NDJSON documents in bulk, splitting them into
+    requests of at most MAX_BULK_BYTES."""
+    if not chunks:
         return {"errors": False, "items": []}
     
     auth = None
     if username and password:
         auth = (username, password)
     
-    # Prepare the bulk data
-    bulk_data = []
-    for doc in docs:
-        bulk_data.append(json.dumps({"index": {"_index": index_name, "_id": doc["_id"]}}))
-        bulk_data.append(json.dumps(doc["_source"]))
+    result = {"errors": False, "items": []}
+    
+    def send(bulk_data):
+        part = send_bulk_body(opensearch_url, bytes(bulk_data), auth)
+        result["errors"] = result["errors"] or part.get("errors", False)
+        result["items"].extend(part.get("items", []))
     
-    bulk_body = "\n".join(bulk_data) + "\n"
-    headers = {"Content-Type": "application/x-ndjson"}
+    bulk_data = bytearray()
+    for chunk in chunks:
+        if bulk_data and len(bulk_data) + len(chunk) > MAX_BULK_BYTES:
+            send(bulk_data)
+            bulk_data.clear()
+        bulk_data += chunk
+    
+    if bulk_data:
+        send(bulk_data)
+    
+    return result
+
+def send_bulk_body(opensearch_url, bulk_body, auth=None):
+    """Send an NDJSON bulk body to OpenSearch, gzip-compressed, with retry mechanism."""
+    # NDJSON compresses very well; a low level keeps the CPU cost small
+    bulk_body = gzip.compress(bulk_body, compresslevel=3)
+    headers = {"Content-Type": "application/x-ndjson", "Content-Encoding": "gzip"}
     
     # Retry settings
     max_retries = 5
@@ -163,7 +400,7 @@ def bulk_index(opensearch_url, index_name, docs, username=None, password=None):
     
     while retry_count <= max_retries:
         try:
-            response = requests.post(
+            response = get_session().post(
                 f"{opensearch_url}/_bulk",
                 headers=headers,
                 data=bulk_body,
@@ -227,7 +464,7 @@ def create_index_if_not_exists(opensearch_url, index_name, username=None, passwo
     
     try:
         # Check if index exists
-        response = requests.head(
+        response = get_session().head(
             f"{opensearch_url}/{index_name}",
             auth=auth
         )
@@ -247,7 +484,7 @@ def create_index_if_not_exists(opensearch_url, index_name, username=None, passwo
                 }
             }
             
-            create_response = requests.put(
+            create_response = get_session().put(
                 f"{opensearch_url}/{index_name}",
                 json=settings,
                 auth=auth,
@@ -260,7 +497,7 @@ def create_index_if_not_exists(opensearch_url, index_name, username=None, passwo
                 logger.error(f"Failed to create index {index_name}: {create_response.text}")
         elif response.status_code == 200:
             # Check if we need to update the existing index settings
-            settings_response = requests.get(
+            settings_response = get_session().get(
                 f"{opensearch_url}/{index_name}/_settings",
                 auth=auth
             )
@@ -273,7 +510,7 @@ def create_index_if_not_exists(opensearch_url, index_name, username=None, passwo
                     
                     if not current_limit or int(current_limit) < field_limit:
                         # Close the index before updating settings
-                        close_response = requests.post(
+                        close_response = get_session().post(
                             f"{opensearch_url}/{index_name}/_close",
                             auth=auth
                         )
@@ -282,7 +519,7 @@ def create_index_if_not_exists(opensearch_url, index_name, username=None, passwo
                             logger.info(f"Closed index {index_name} to update settings")
                             
                             # Update the field limit
-                            update_response = requests.put(
+                            update_response = get_session().put(
                                 f"{opensearch_url}/{index_name}/_settings",
                                 json={
                                     "index.mapping.total_fields.limit": field_limit,
@@ -299,7 +536,7 @@ def create_index_if_not_exists(opensearch_url, index_name, username=None, passwo
                                 logger.warning(f"Could not update field limit for existing index: {update_response.text}")
                             
                             # Reopen the index
-                            open_response = requests.post(
+                            open_response = get_session().post(
                                 f"{opensearch_url}/{index_name}/_open",
                                 auth=auth
                             )
@@ -320,51 +557,134 @@ def create_index_if_not_exists(opensearch_url, index_name, username=None, passwo
     except Exception as e:
         logger.error(f"Error creating index: {e}")
 
-def index_xml_files(xml_files, opensearch_url, index_name, bulk_size=100, num_workers=4, username=None, password=None):
-    """Index XML files in parallel using multiple workers."""
+def index_xml_files(xml_files, opensearch_url, index_name, bulk_size=500, num_workers=None, username=None, password=None):
+    """Index XML files in parallel using multiple worker processes.
+    
+    xml_files yields (name, data) pairs, where data is the file's bytes or
+    None to read it from the path in name. Returns the number of files seen.
+    """
     create_index_if_not_exists(opensearch_url, index_name, username, password)
     
-    # Process XML files in parallel
-    processed_docs = []
+    # Process XML files in parallel. Serialized documents are appended to one
+    # buffer that is flushed once it holds bulk_size documents or reaches
+    # MAX_BULK_BYTES, so memory is bounded by the buffer rather than the batch.
+    bulk_buffer = bytearray()
+    buffered_docs = 0
     success_count = 0
     error_count = 0
     
-    with concurrent.futures.ThreadPoolExecutor(max_workers=num_workers) as executor:
-        futures = {executor.submit(process_xml_file, xml_file): xml_file for xml_file in xml_files}
-        
-        with tqdm(total=len(xml_files), desc="Processing XML files") as pbar:
-            for future in concurrent.futures.as_completed(futures):
-                xml_file = futures[future]
-                try:
-                    result = future.result()
-                    if result:
-                        processed_docs.append(result)
-                        success_count += 1
-                    else:
-                        error_count += 1
-                except Exception as e:
-                    logger.error(f"Error processing {xml_file}: {e}")
+    # XML parsing is CPU-bound, so use processes to get around the GIL.
+    # Files are sent in small batches to amortize pickling, and only a bounded
+    # number of batches is read ahead so archives are never held in memory whole.
+    num_workers = num_workers or os.cpu_count() or 1
+    executor = get_xml_pool(num_workers)
+    max_pending_batches = num_workers * 4
+    pending_batches = {}
+    
+    # Bulk requests are sent from a small thread pool so parsing continues while
+    # they are in flight; at most max_pending_bulks batches are held at once
+    max_pending_bulks = 4
+    pending_bulks = set()
+    
+    def flush_bulk():
+        nonlocal pending_bulks, buffered_docs
+        if len(pending_bulks) >= max_pending_bulks:
+            _, pending_bulks = concurrent.futures.wait(pending_bulks, return_when=concurrent.futures.FIRST_COMPLETED)
+        pending_bulks.add(bulk_executor.submit(bulk_index_raw, opensearch_url, [bytes(bulk_buffer)], username, password))
+        bulk_buffer.clear()
+        buffered_docs = 0
+    
+    def collect(futures):
+        nonlocal bulk_buffer, buffered_docs, success_count, error_count
+        for future in futures:
+            batch_size = pending_batches.pop(future)
+            try:
+                results = future.result()
+            except Exception as e:
+                logger.error(f"Error processing XML batch: {e}")
+                error_count += batch_size
+                pbar.update(batch_size)
+                continue
+            
+            for result in results:
+                if result:
+                    bulk_buffer += result
+                    buffered_docs += 1
+                    success_count += 1
+                    
+                    # If we have enough documents, index them in bulk
+                    if buffered_docs >= bulk_size or len(bulk_buffer) >= MAX_BULK_BYTES:
+                        flush_bulk()
+                else:
                     error_count += 1
-                
-                pbar.update(1)
-                
-                # If we have enough documents, index them in bulk
-                if len(processed_docs) >= bulk_size:
-                    bulk_result = bulk_index(opensearch_url, index_name, processed_docs, username, password)
-                    processed_docs = []
-                    # Add a small delay between bulk requests to reduce load on the server
-                    time.sleep(0.5)
+            
+            pbar.update(len(results))
+    
+    def submit_batch(batch):
+        nonlocal executor
+        try:
+            future = executor.submit(process_xml_batch, batch, index_name)
+        except BrokenProcessPool:
+            # A dead worker breaks the whole pool; its batches fail in collect
+            logger.warning("XML worker pool is broken, starting a new one")
+            executor = get_xml_pool(num_workers, broken=executor)
+            future = executor.submit(process_xml_batch, batch, index_name)
+        pending_batches[future] = len(batch)
     
-    # Index any remaining documents
-    if processed_docs:
-        bulk_index(opensearch_url, index_name, processed_docs, username, password)
+    with concurrent.futures.ThreadPoolExecutor(max_workers=2) as bulk_executor:
+        with tqdm(desc="Processing XML files") as pbar:
+            for batch in chunk_iter(xml_files, XML_BATCH_SIZE):
+                if len(pending_batches) >= max_pending_batches:
+                    done, _ = concurrent.futures.wait(pending_batches, return_when=concurrent.futures.FIRST_COMPLETED)
+                    collect(done)
+                submit_batch(batch)
+            
+            collect(concurrent.futures.as_completed(list(pending_batches)))
+        
+        # Index any remaining documents
+        if bulk_buffer:
+            flush_bulk()
+        
+        concurrent.futures.wait(pending_bulks)
     
     logger.info(f"Indexing complete. Success: {success_count}, Errors: {error_count}")
+    return success_count + error_count
 
-def process_package(package_path, opensearch_url, index_name, bulk_size=100, num_workers=4, username=None, password=None):
-    """Process a TED package file: extract, parse XML files, and index into OpenSearch."""
-    # Create a temporary directory for extraction
-    with tempfile.TemporaryDirectory() as temp_dir:
+def default_temp_dir_root():
+    """Return where zip packages are extracted: TEMP_DIR_ROOT if set, else the
+    RAM-backed /dev/shm when available, else the system temp directory."""
+    temp_dir_root = os.getenv("TEMP_DIR_ROOT")
+    if temp_dir_root:
+        return temp_dir_root
+    if os.path.isdir("/dev/shm") and os.access("/dev/shm", os.W_OK):
+        return "/dev/shm"
+    return tempfile.gettempdir()
+
+def process_package(package_path, opensearch_url, index_name, bulk_size=500, num_workers=None, username=None, password=None, temp_dir_root=None):
+    """Process a TED package file: parse its XML files and index them into OpenSearch."""
+    is_tar = package_path.endswith('.tar.gz') or package_path.endswith('.tgz')
+    if not is_tar and not package_path.endswith('.zip'):
+        is_tar = is_gzip_file(package_path)
+    
+    if is_tar:
+        # Stream XML members straight out of the archive instead of extracting them
+        logger.info(f"Streaming XML files from {package_path}")
+        try:
+            with open_tar_gz(package_path) as tar_ref:
+                file_count = index_xml_files(iter_tar_xml(tar_ref), opensearch_url, index_name, bulk_size, num_workers, username, password)
+        except (tarfile.TarError, OSError, EOFError) as e:
+            logger.error(f"Bad tar.gz file {package_path}: {e}")
+            return False
+        
+        if not file_count:
+            logger.warning(f"No XML files found in {package_path}")
+            return False
+        
+        logger.info(f"Successfully processed package {package_path}")
+        return True
+    
+    # Zip packages are extracted to a temporary directory, on tmpfs by default
+    with tempfile.TemporaryDirectory(dir=temp_dir_root or default_temp_dir_root()) as temp_dir:
         logger.info(f"Created temporary directory: {temp_dir}")
         
         # Extract the package
@@ -379,7 +699,7 @@ def process_package(package_path, opensearch_url, index_name, bulk_size=100, num
             return False
         
         # Index the XML files
-        index_xml_files(xml_files, opensearch_url, index_name, bulk_size, num_workers, username, password)
+        index_xml_files(((xml_file, None) for xml_file in xml_files), opensearch_url, index_name, bulk_size, num_workers, username, password)
         
         logger.info(f"Successfully processed package {package_path}")
         return True
@@ -395,18 +715,21 @@ def main():
                         help=f"OpenSearch index name (default: {os.getenv('OPENSEARCH_INDEX', 'ted')})")
     parser.add_argument("-b", "--bulk-size", 
                         type=int, 
-                        default=int(os.getenv("BULK_SIZE", "100")), 
-                        help=f"Number of documents to index in each bulk request (default: {os.getenv('BULK_SIZE', '100')})")
+                        default=int(os.getenv("BULK_SIZE", "500")), 
+                        help=f"Maximum number of documents to index in each bulk request (default: {os.getenv('BULK_SIZE', '500')})")
     parser.add_argument("-w", "--workers", 
                         type=int, 
-                        default=int(os.getenv("NUM_WORKERS", "10")), 
-                        help=f"Number of parallel workers (default: {os.getenv('NUM_WORKERS', '10')})")
+                        default=int(os.getenv("NUM_WORKERS", os.cpu_count() or 1)), 
+                        help=f"Number of parallel worker processes (default: {os.getenv('NUM_WORKERS', os.cpu_count() or 1)})")
     parser.add_argument("--username", 
                         default=os.getenv("OPENSEARCH_USERNAME", ""), 
                         help="OpenSearch username")
     parser.add_argument("--password", 
                         default=os.getenv("OPENSEARCH_PASSWORD", ""), 
                         help="OpenSearch password")
+    parser.add_argument("--temp-dir", 
+                        default=os.getenv("TEMP_DIR_ROOT", ""), 
+                        help="Directory in which zip packages are extracted (default: /dev/shm when available)")
     
     args = parser.parse_args()
     
@@ -423,7 +746,8 @@ def main():
         args.bulk_size,
         args.workers,
         args.username if args.username else None,
-        args.password if args.password else None
+        args.password if args.password else None,
+        args.temp_dir if args.temp_dir else None
     )
     
     if not success: